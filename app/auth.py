@@ -1,49 +1,172 @@
-from typing import Optional
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
 
-from fastapi import Header, HTTPException, Security
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+import orjson
+from cachetools import TTLCache
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from google.auth.transport import requests as grequests
 from google.oauth2 import id_token
+# The router matches routes with this helper; using it here keeps the
+# middleware's idea of the route identical, including root_path handling.
+from starlette._utils import get_route_path
 
 from .config import Settings
 
-bearer_scheme = HTTPBearer(auto_error=False)
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
 
+# Verified ID tokens keyed by SHA-256 of the raw token. Entries carry the
+# token's own expiry so a hit never outlives the token itself.
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+_TOKEN_CACHE_LOCK = threading.Lock()
+_EXP_SKEW_SECONDS = 30
 
-def get_principal_dependency(settings: Settings):
-    async def _get_principal(
-        credentials: Optional[HTTPAuthorizationCredentials] = Security(bearer_scheme),
-        x_principal: Optional[str] = Header(default=None),
-    ) -> str:
-        if settings.auth_mode == "none":
-            return "anonymous"
+# requests.Session is not documented as thread-safe, so each thread keeps
+# its own transport (and connection pool) for fetching Google's certs.
+_AUTH_REQUEST_LOCAL = threading.local()
 
-        if settings.auth_mode == "header":
-            if not x_principal:
-                raise HTTPException(status_code=401, detail="Missing X-Principal header")
-            return x_principal.strip().lower()
+# Token hash -> in-flight verification. Only touched from the event loop,
+# with no await between lookup and insert, so it needs no lock.
+_INFLIGHT: Dict[bytes, "asyncio.Task[str]"] = {}
 
-        # id_token mode
-        if not credentials or credentials.scheme.lower() != "bearer":
-            raise HTTPException(status_code=401, detail="Missing Bearer token")
+# Routes that require a principal; everything else (health, docs, SSE
+# keepalive) passes through untouched.
+PROTECTED_ROUTES = frozenset({("POST", "/v1/execute"), ("POST", "/mcp")})
 
-        token = (credentials.credentials or "").strip()
-        if not token:
-            raise HTTPException(status_code=401, detail="Missing Bearer token")
+
+def _auth_request() -> grequests.Request:
+    request = getattr(_AUTH_REQUEST_LOCAL, "request", None)
+    if request is None:
+        request = _AUTH_REQUEST_LOCAL.request = grequests.Request()
+    return request
+
+
+def _verify_token(token: str, audience: Optional[str]) -> Dict[str, Any]:
+    # Runs in a worker thread: cert fetches and RSA verification block.
+    return id_token.verify_oauth2_token(token, _auth_request(), audience)
+
+
+async def _get_principal(
+    settings: Settings,
+    authorization: Optional[str],
+    x_principal: Optional[str],
+) -> str:
+    if settings.auth_mode == "none":
+        return "anonymous"
+
+    if settings.auth_mode == "header":
+        if not x_principal:
+            raise HTTPException(status_code=401, detail="Missing X-Principal header")
+        return x_principal.strip().lower()
+
+    # id_token mode
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="Missing Bearer token")
+
+    token = token.strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing Bearer token")
+
+    key = hashlib.sha256(token.encode()).digest()
+    with _TOKEN_CACHE_LOCK:
+        entry = _TOKEN_CACHE.get(key)
+    if entry is not None and entry["exp"] > time.time() + _EXP_SKEW_SECONDS:
+        return entry["principal"]
+
+    # Concurrent misses for the same token share one verification. It runs
+    # as its own task so a cancelled request does not strand the others.
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(
+            _verify_principal(key, token, settings.mcp_audience or None)
+        )
+        _INFLIGHT[key] = task
+        task.add_done_callback(functools.partial(_inflight_done, key))
+    return await asyncio.shield(task)
+
+
+async def _verify_principal(key: bytes, token: str, audience: Optional[str]) -> str:
+    try:
+        info = await run_in_threadpool(_verify_token, token, audience)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Invalid ID token: {e}") from e
+
+    principal = (info.get("email") or info.get("sub") or "").strip().lower()
+    if not principal:
+        raise HTTPException(status_code=401, detail="No principal in token")
+
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[key] = {"principal": principal, "exp": int(info["exp"])}
+
+    return principal
+
+
+def _inflight_done(key: bytes, task: "asyncio.Task[str]") -> None:
+    _INFLIGHT.pop(key, None)
+    if not task.cancelled():
+        # Marks the exception as retrieved when every waiter went away.
+        task.exception()
+
+
+class PrincipalASGIMiddleware:
+    """Resolves the caller's principal and stores it in ``scope["state"]``.
+
+    Routes read it back via ``request.state.principal``. Failures are
+    answered with a 401 JSON body directly, without entering the app.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        settings: Settings,
+        protected_routes: Iterable[tuple[str, str]] = PROTECTED_ROUTES,
+    ):
+        self.app = app
+        self.settings = settings
+        self.protected_routes = frozenset(protected_routes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (scope["method"], get_route_path(scope)) not in self.protected_routes:
+            await self.app(scope, receive, send)
+            return
+
+        authorization: Optional[str] = None
+        x_principal: Optional[str] = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-principal":
+                x_principal = value.decode("latin-1")
 
         try:
-            info = id_token.verify_oauth2_token(
-                token,
-                grequests.Request(),
-                settings.mcp_audience or None,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=401, detail=f"Invalid ID token: {e}") from e
+            principal = await _get_principal(self.settings, authorization, x_principal)
+        except HTTPException as e:
+            await _send_json(send, e.status_code, {"detail": e.detail})
+            return
 
-        principal = (info.get("email") or info.get("sub") or "").strip().lower()
-        if not principal:
-            raise HTTPException(status_code=401, detail="No principal in token")
+        scope.setdefault("state", {})["principal"] = principal
+        await self.app(scope, receive, send)
 
-        return principal
 
-    return _get_principal
+async def _send_json(send: Send, status_code: int, content: Dict[str, Any]) -> None:
+    body = orjson.dumps(content)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
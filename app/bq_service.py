@@ -1,53 +1,224 @@
+import base64
 import datetime as dt
 import decimal
-import re
-from typing import Any, Dict, List
+import functools
+import string
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import orjson
+from cachetools import TTLCache
 from google.cloud import bigquery
+from google.cloud.bigquery.table import RowIterator
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types as bqs_types
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 
 from .config import Settings
 from .models import ExecuteArgs, Operation, TableField
 
 
-IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,127}$")
-ALLOWED_TYPES = {
-    "STRING", "BYTES", "INT64", "FLOAT64", "NUMERIC", "BIGNUMERIC",
-    "BOOL", "TIMESTAMP", "DATE", "TIME", "DATETIME", "JSON"
+_IDENT_FIRST_CHARS = frozenset(string.ascii_letters + "_")
+_IDENT_MAX_LEN = 128
+
+_PB = descriptor_pb2.FieldDescriptorProto
+# Storage Write API wire types for column types whose JSON row values can be
+# set on the proto field as-is. Tables with any other column type (RECORD,
+# TIMESTAMP, DATE, GEOGRAPHY, ...) keep using insert_rows_json.
+_PROTO_TYPES = {
+    "STRING": _PB.TYPE_STRING,
+    "INT64": _PB.TYPE_INT64,
+    "INTEGER": _PB.TYPE_INT64,
+    "FLOAT64": _PB.TYPE_DOUBLE,
+    "FLOAT": _PB.TYPE_DOUBLE,
+    "BOOL": _PB.TYPE_BOOL,
+    "BOOLEAN": _PB.TYPE_BOOL,
+    "NUMERIC": _PB.TYPE_STRING,
+    "BIGNUMERIC": _PB.TYPE_STRING,
+    "TIME": _PB.TYPE_STRING,
+    "DATETIME": _PB.TYPE_STRING,
+    "JSON": _PB.TYPE_STRING,
 }
 
 
+@functools.lru_cache(maxsize=4096)
 def _ensure_ident(name: str, label: str) -> str:
-    if not IDENT_RE.match(name):
+    # Equivalent to [A-Za-z_][A-Za-z0-9_]{0,127} without the regex engine.
+    if not (
+        0 < len(name) <= _IDENT_MAX_LEN
+        and name[0] in _IDENT_FIRST_CHARS
+        and name.isascii()
+        and name.replace("_", "a").isalnum()
+    ):
         raise ValueError(f"Invalid {label}: {name}")
     return name
 
 
 def _normalize_value(v: Any) -> Any:
-    if isinstance(v, decimal.Decimal):
-        return str(v)
-    if isinstance(v, (dt.datetime, dt.date, dt.time)):
-        return v.isoformat()
-    if isinstance(v, list):
-        return [_normalize_value(x) for x in v]
-    if isinstance(v, dict):
-        return {k: _normalize_value(val) for k, val in v.items()}
-    return v
+    normalizer = _NORMALIZERS.get(type(v))
+    return v if normalizer is None else normalizer(v)
+
+
+def _normalize_row(row: Any) -> Dict[str, Any]:
+    return {k: _normalize_value(v) for k, v in row.items()}
+
+
+def _bytes_to_base64(v: bytes) -> str:
+    return base64.b64encode(v).decode("ascii")
+
+
+# Exact-type dispatch; BigQuery rows only carry these concrete types, so
+# subclass matching is not needed. Dates and times are left to orjson,
+# which emits the same ISO 8601 text as isoformat(). BYTES become base64
+# text, as in BigQuery's own JSON encoding.
+_NORMALIZERS: Dict[type, Callable[[Any], Any]] = {
+    decimal.Decimal: str,
+    bytes: _bytes_to_base64,
+    list: lambda v: [_normalize_value(x) for x in v],
+    dict: _normalize_row,
+}
+
+
+def _json_default(v: Any) -> Any:
+    # Last resort for values _NORMALIZERS does not cover, so encoding a
+    # streamed row never fails after the response has started.
+    if isinstance(v, bytes):
+        return _bytes_to_base64(v)
+    return str(v)
+
+
+def _dumps_row(row: Any) -> bytes:
+    return orjson.dumps(_normalize_row(row), default=_json_default)
+
+
+def _build_row_proto(schema: List[bigquery.SchemaField]) -> Optional[Tuple[descriptor_pb2.DescriptorProto, type]]:
+    """Returns the row descriptor and message class for a table schema, or None."""
+    desc = descriptor_pb2.DescriptorProto(name="Row")
+    for number, field in enumerate(schema, start=1):
+        proto_type = _PROTO_TYPES.get(field.field_type)
+        if proto_type is None:
+            return None
+        desc.field.add(
+            name=field.name,
+            number=number,
+            type=proto_type,
+            label=_PB.LABEL_REPEATED if field.mode == "REPEATED" else _PB.LABEL_OPTIONAL,
+        )
+
+    # One pool per table keeps the generic "Row" message names from clashing.
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(descriptor_pb2.FileDescriptorProto(name="row.proto", message_type=[desc]))
+    return desc, message_factory.GetMessageClass(pool.FindMessageTypeByName("Row"))
+
+
+# JSON value types accepted per proto field type. protobuf would otherwise
+# coerce bool <-> int silently, which insert_rows_json does not do.
+_PROTO_VALUE_TYPES: Dict[int, Tuple[type, ...]] = {
+    _PB.TYPE_BOOL: (bool,),
+    _PB.TYPE_INT64: (int,),
+    _PB.TYPE_DOUBLE: (int, float),
+    _PB.TYPE_STRING: (str,),
+}
+
+
+def _check_proto_value(field: Any, v: Any) -> None:
+    if type(v) not in _PROTO_VALUE_TYPES[field.type]:
+        raise TypeError(f"{type(v).__name__} value for column {field.name}")
+
+
+def _serialize_row(message_cls: type, row: Dict[str, Any]) -> bytes:
+    """Encodes one row; raises on unknown keys or mismatched value types."""
+    fields = message_cls.DESCRIPTOR.fields_by_name
+    msg = message_cls()
+    for k, v in row.items():
+        if v is None:
+            continue
+        field = fields.get(k)
+        if field is None:
+            raise AttributeError(f"Unknown column: {k}")
+        if isinstance(v, list):
+            for x in v:
+                _check_proto_value(field, x)
+            getattr(msg, k).extend(v)
+        else:
+            _check_proto_value(field, v)
+            setattr(msg, k, v)
+    return msg.SerializeToString()
+
+
+@functools.lru_cache(maxsize=1024)
+def _table_refs(project_id: str, dataset: str, table: str) -> Tuple[str, str]:
+    """Returns the backticked SQL reference and the plain table id."""
+    ds = _ensure_ident(dataset, "dataset")
+    tb = _ensure_ident(table, "table")
+    table_id = f"{project_id}.{ds}.{tb}"
+    return f"`{table_id}`", table_id
+
+
+def _col_ref(col: str) -> str:
+    c = _ensure_ident(col, "column")
+    return f"`{c}`"
+
+
+def _eq_clauses(keys: Tuple[str, ...], prefix: str) -> List[str]:
+    return [f"{_col_ref(k)} = @{prefix}{i}" for i, k in enumerate(keys)]
+
+
+def _scalar_params(values: Any, prefix: str) -> List[bigquery.ScalarQueryParameter]:
+    return [
+        bigquery.ScalarQueryParameter(f"{prefix}{i}", _param_type(v), v)
+        for i, v in enumerate(values)
+    ]
+
+
+def _query_job_config(params: List[bigquery.ScalarQueryParameter]) -> bigquery.QueryJobConfig:
+    # Built fresh per query: a copy.copy'd template would share its
+    # _properties dict, so setting parameters would leak across requests.
+    return bigquery.QueryJobConfig(query_parameters=params, use_legacy_sql=False)
+
+
+# SQL text depends only on the query shape (table, columns, filter/set keys);
+# values are always bound as @-parameters named by position, so the text can
+# be cached and reused across calls.
+@functools.lru_cache(maxsize=512)
+def _build_select_sql(table_ref: str, columns: Tuple[str, ...], filter_keys: Tuple[str, ...]) -> str:
+    cols = ", ".join(_col_ref(c) for c in columns) if columns else "*"
+    sql = f"SELECT {cols} FROM {table_ref}"
+    if filter_keys:
+        sql += " WHERE " + " AND ".join(_eq_clauses(filter_keys, "f"))
+    return sql + " LIMIT @limit"
+
+
+@functools.lru_cache(maxsize=512)
+def _build_update_sql(table_ref: str, set_keys: Tuple[str, ...], filter_keys: Tuple[str, ...]) -> str:
+    return f"""
+        UPDATE {table_ref}
+        SET {", ".join(_eq_clauses(set_keys, "s"))}
+        WHERE {" AND ".join(_eq_clauses(filter_keys, "w"))}
+        """
+
+
+@functools.lru_cache(maxsize=512)
+def _build_delete_sql(table_ref: str, filter_keys: Tuple[str, ...]) -> str:
+    sql = f"DELETE FROM {table_ref}"
+    if filter_keys:
+        sql += " WHERE " + " AND ".join(_eq_clauses(filter_keys, "d"))
+    return sql
+
+
+# Filter/set values come from parsed JSON, so exact types suffice; bool is
+# its own key and never falls through to INT64.
+_PARAM_TYPES: Dict[type, str] = {
+    bool: "BOOL",
+    int: "INT64",
+    float: "FLOAT64",
+    decimal.Decimal: "NUMERIC",
+    dt.datetime: "TIMESTAMP",
+    dt.date: "DATE",
+}
 
 
 def _param_type(value: Any) -> str:
-    if isinstance(value, bool):
-        return "BOOL"
-    if isinstance(value, int):
-        return "INT64"
-    if isinstance(value, float):
-        return "FLOAT64"
-    if isinstance(value, decimal.Decimal):
-        return "NUMERIC"
-    if isinstance(value, dt.datetime):
-        return "TIMESTAMP"
-    if isinstance(value, dt.date):
-        return "DATE"
-    return "STRING"
+    return _PARAM_TYPES.get(type(value), "STRING")
 
 
 class BigQueryService:
@@ -57,15 +228,19 @@ class BigQueryService:
         self.location = settings.bigquery_location
         self.max_select_limit = settings.max_select_limit
         self.allow_full_table_delete = settings.allow_full_table_delete
+        self.storage_write_min_rows = settings.storage_write_min_rows
+        self.write_client = BigQueryWriteClient()
+        # table_id -> (descriptor, message class), or None when the schema
+        # cannot be sent over the Storage Write API. Expires so schema
+        # changes are picked up.
+        self._row_protos: TTLCache = TTLCache(maxsize=256, ttl=600)
+        self._row_protos_lock = threading.Lock()
 
-    def _table_ref(self, dataset: str, table: str) -> str:
-        ds = _ensure_ident(dataset, "dataset")
-        tb = _ensure_ident(table, "table")
-        return f"`{self.settings.project_id}.{ds}.{tb}`"
+    def _refs(self, dataset: str, table: str) -> Tuple[str, str]:
+        return _table_refs(self.settings.project_id, dataset, table)
 
-    def _col_ref(self, col: str) -> str:
-        c = _ensure_ident(col, "column")
-        return f"`{c}`"
+    def _table_ref(self, dataset: str, table: str) -> str:
+        return self._refs(dataset, table)[0]
 
     def execute(self, args: ExecuteArgs) -> Dict[str, Any]:
         op = args.operation
@@ -81,58 +256,73 @@ class BigQueryService:
             return self._delete(args)
         raise ValueError(f"Unsupported operation: {op}")
 
-    def _select(self, args: ExecuteArgs) -> Dict[str, Any]:
+    def _run_select(self, args: ExecuteArgs) -> RowIterator:
         table_ref = self._table_ref(args.dataset, args.table)
-
-        if args.columns:
-            cols = ", ".join(self._col_ref(c) for c in args.columns)
-        else:
-            cols = "*"
-
+        filters = args.filters or {}
         limit = min(max(int(args.limit or 100), 1), self.max_select_limit)
 
-        sql = f"SELECT {cols} FROM {table_ref}"
-        params: List[bigquery.ScalarQueryParameter] = []
-
-        if args.filters:
-            where_parts = []
-            for i, (k, v) in enumerate(args.filters.items()):
-                col = self._col_ref(k)
-                pname = f"f{i}"
-                where_parts.append(f"{col} = @{pname}")
-                params.append(bigquery.ScalarQueryParameter(pname, _param_type(v), v))
-            sql += " WHERE " + " AND ".join(where_parts)
-
-        sql += " LIMIT @limit"
+        sql = _build_select_sql(table_ref, tuple(args.columns or ()), tuple(filters))
+        params = _scalar_params(filters.values(), "f")
         params.append(bigquery.ScalarQueryParameter("limit", "INT64", limit))
 
-        job_config = bigquery.QueryJobConfig(query_parameters=params, use_legacy_sql=False)
-        job = self.client.query(sql, location=self.location, job_config=job_config)
-        rows = [dict(r.items()) for r in job.result()]
-        rows = [_normalize_value(r) for r in rows]
+        job_config = _query_job_config(params)
+        return self.client.query_and_wait(
+            sql,
+            location=self.location,
+            job_config=job_config,
+            max_results=limit,
+        )
+
+    def _select(self, args: ExecuteArgs) -> Dict[str, Any]:
+        rows_iter = self._run_select(args)
+        rows = [_normalize_row(r) for r in rows_iter]
 
         return {
             "operation": "SELECT",
             "row_count": len(rows),
             "rows": rows,
-            "job_id": job.job_id,
+            # Short queries may run without a job, in which case there is no id.
+            "job_id": getattr(rows_iter, "job_id", None),
         }
 
+    def stream_select(self, args: ExecuteArgs) -> Iterator[bytes]:
+        """Runs a SELECT and returns its result object as JSON chunks.
+
+        The query runs and its first page is encoded before this returns,
+        so query and encoding errors on that page surface to the caller;
+        later pages are encoded one row at a time as they arrive. The
+        document has the same keys as ``_select``'s result.
+        """
+        rows_iter = self._run_select(args)
+        pages = iter(rows_iter.pages)
+        first_page = [_dumps_row(r) for r in next(pages, ())]
+
+        def gen() -> Iterator[bytes]:
+            yield b'{"operation":"SELECT","rows":['
+            yield b",".join(first_page)
+            row_count = len(first_page)
+            for page in pages:
+                for r in page:
+                    yield (b"," if row_count else b"") + _dumps_row(r)
+                    row_count += 1
+            yield b'],"row_count":%d,"job_id":%s}' % (
+                row_count,
+                orjson.dumps(getattr(rows_iter, "job_id", None)),
+            )
+
+        return gen()
+
     def _create_table(self, args: ExecuteArgs) -> Dict[str, Any]:
         if not args.schema:
             raise ValueError("schema is required for CREATE_TABLE")
 
-        _ensure_ident(args.dataset, "dataset")
-        _ensure_ident(args.table, "table")
+        _, table_id = self._refs(args.dataset, args.table)
 
         schema_fields = []
         for f in args.schema:
-            if f.type not in ALLOWED_TYPES:
-                raise ValueError(f"Unsupported BigQuery type: {f.type}")
             _ensure_ident(f.name, "field name")
             schema_fields.append(bigquery.SchemaField(f.name, f.type, mode=f.mode))
 
-        table_id = f"{self.settings.project_id}.{args.dataset}.{args.table}"
         table = bigquery.Table(table_id, schema=schema_fields)
         created = self.client.create_table(table, exists_ok=args.if_not_exists)
 
@@ -146,19 +336,81 @@ class BigQueryService:
         if not args.rows:
             raise ValueError("rows is required for INSERT")
 
-        _ensure_ident(args.dataset, "dataset")
-        _ensure_ident(args.table, "table")
-
-        table_id = f"{self.settings.project_id}.{args.dataset}.{args.table}"
-        errors = self.client.insert_rows_json(table_id, args.rows)
-        if errors:
-            raise ValueError(f"BigQuery insert errors: {errors}")
+        _, table_id = self._refs(args.dataset, args.table)
+        if len(args.rows) < self.storage_write_min_rows or not self._append_rows(args, table_id):
+            errors = self.client.insert_rows_json(table_id, args.rows)
+            if errors:
+                raise ValueError(f"BigQuery insert errors: {errors}")
 
         return {
             "operation": "INSERT",
             "inserted_rows": len(args.rows),
         }
 
+    def _row_proto(self, table_id: str) -> Optional[Tuple[descriptor_pb2.DescriptorProto, type]]:
+        with self._row_protos_lock:
+            if table_id in self._row_protos:
+                return self._row_protos[table_id]
+
+        try:
+            schema = self.client.get_table(table_id).schema
+        except Exception:
+            # Leave the error (e.g. missing table) to insert_rows_json.
+            return None
+
+        try:
+            row_proto = _build_row_proto(schema)
+        except TypeError:
+            # Column names that are not valid proto identifiers (flexible
+            # column names such as "my-col") are rejected by the pool.
+            row_proto = None
+        with self._row_protos_lock:
+            self._row_protos[table_id] = row_proto
+        return row_proto
+
+    def _append_rows(self, args: ExecuteArgs, table_id: str) -> bool:
+        """Writes rows through the Storage Write API default stream.
+
+        Returns False, having sent nothing, when the table schema or the
+        rows cannot be encoded; the caller then falls back to
+        insert_rows_json.
+        """
+        row_proto = self._row_proto(table_id)
+        if row_proto is None:
+            return False
+        desc, message_cls = row_proto
+
+        try:
+            serialized = [_serialize_row(message_cls, r) for r in args.rows]
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+        stream = self.write_client.write_stream_path(
+            self.settings.project_id, args.dataset, args.table, "_default"
+        )
+        request = bqs_types.AppendRowsRequest(
+            write_stream=stream,
+            proto_rows=bqs_types.AppendRowsRequest.ProtoData(
+                writer_schema=bqs_types.ProtoSchema(proto_descriptor=desc),
+                rows=bqs_types.ProtoRows(serialized_rows=serialized),
+            ),
+        )
+        # The generated client does not add the routing header for this
+        # streaming call; without it the API cannot route to the table's region.
+        response = next(iter(self.write_client.append_rows(
+            iter([request]),
+            metadata=(("x-goog-request-params", f"write_stream={stream}"),),
+        )))
+        if response.row_errors or response.error.code:
+            with self._row_protos_lock:
+                self._row_protos.pop(table_id, None)
+            errors = [
+                {"index": e.index, "message": e.message} for e in response.row_errors
+            ] or [{"message": response.error.message}]
+            raise ValueError(f"BigQuery insert errors: {errors}")
+
+        return True
+
     def _update(self, args: ExecuteArgs) -> Dict[str, Any]:
         if not args.set_values:
             raise ValueError("set_values is required for UPDATE")
@@ -167,32 +419,14 @@ class BigQueryService:
 
         table_ref = self._table_ref(args.dataset, args.table)
 
-        set_parts = []
-        where_parts = []
-        params: List[bigquery.ScalarQueryParameter] = []
-
-        for i, (k, v) in enumerate(args.set_values.items()):
-            col = self._col_ref(k)
-            pname = f"s{i}"
-            set_parts.append(f"{col} = @{pname}")
-            params.append(bigquery.ScalarQueryParameter(pname, _param_type(v), v))
-
-        for i, (k, v) in enumerate(args.filters.items()):
-            col = self._col_ref(k)
-            pname = f"w{i}"
-            where_parts.append(f"{col} = @{pname}")
-            params.append(bigquery.ScalarQueryParameter(pname, _param_type(v), v))
-
-        sql = f"""
-        UPDATE {table_ref}
-        SET {", ".join(set_parts)}
-        WHERE {" AND ".join(where_parts)}
-        """
+        sql = _build_update_sql(table_ref, tuple(args.set_values), tuple(args.filters))
+        params = _scalar_params(args.set_values.values(), "s")
+        params += _scalar_params(args.filters.values(), "w")
 
         job = self.client.query(
             sql,
             location=self.location,
-            job_config=bigquery.QueryJobConfig(query_parameters=params, use_legacy_sql=False),
+            job_config=_query_job_config(params),
         )
         job.result()
 
@@ -204,26 +438,18 @@ class BigQueryService:
 
     def _delete(self, args: ExecuteArgs) -> Dict[str, Any]:
         table_ref = self._table_ref(args.dataset, args.table)
-        params: List[bigquery.ScalarQueryParameter] = []
-
-        if args.filters:
-            where_parts = []
-            for i, (k, v) in enumerate(args.filters.items()):
-                col = self._col_ref(k)
-                pname = f"d{i}"
-                where_parts.append(f"{col} = @{pname}")
-                params.append(bigquery.ScalarQueryParameter(pname, _param_type(v), v))
-            where_sql = " WHERE " + " AND ".join(where_parts)
-        else:
-            if not self.allow_full_table_delete:
-                raise ValueError("DELETE without filters is blocked by policy")
-            where_sql = ""
 
-        sql = f"DELETE FROM {table_ref}{where_sql}"
+        if not args.filters and not self.allow_full_table_delete:
+            raise ValueError("DELETE without filters is blocked by policy")
+
+        filters = args.filters or {}
+        sql = _build_delete_sql(table_ref, tuple(filters))
+        params = _scalar_params(filters.values(), "d")
+
         job = self.client.query(
             sql,
             location=self.location,
-            job_config=bigquery.QueryJobConfig(query_parameters=params, use_legacy_sql=False),
+            job_config=_query_job_config(params),
         )
         job.result()
 
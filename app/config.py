@@ -22,4 +22,5 @@ class Settings(BaseSettings):
 
     policy_json: str
     max_select_limit: int = 1000
+    storage_write_min_rows: int = 100
     allow_full_table_delete: bool = False
@@ -1,17 +1,18 @@
 import asyncio
 import logging
-from typing import Any, Dict
+from typing import Dict, Iterator, Set
 
-from fastapi import FastAPI, HTTPException, Security
+import orjson
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
-from .auth import get_principal_dependency
+from .auth import PrincipalASGIMiddleware
 from .bq_service import BigQueryService
 from .config import Settings
 from .logging_utils import configure_logging
 from .mcp_protocol import handle_mcp_request
-from .models import ExecuteArgs, JsonRpcRequest
+from .models import ExecuteArgs, JsonRpcRequest, Operation
 from .policy import load_policy
 
 settings = Settings()
@@ -23,9 +24,10 @@ app = FastAPI(
     version="1.0.1",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
 )
 
-principal_dependency = get_principal_dependency(settings)
+app.add_middleware(PrincipalASGIMiddleware, settings=settings)
 bq_service = BigQueryService(settings)
 policy_engine = load_policy(settings)
 
@@ -42,40 +44,69 @@ async def healthz() -> Dict[str, str]:
     return _health_payload()
 
 
-@app.get("/readyz")
-async def readyz() -> JSONResponse:
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _bq_probe() -> None:
+    list(bq_service.client.query_and_wait("SELECT 1 AS ok", location=bq_service.location))
+
+
+async def _warm_bigquery() -> None:
     try:
-        def _probe():
-            job = bq_service.client.query("SELECT 1 AS ok", location=bq_service.location)
-            _ = list(job.result())
+        await run_in_threadpool(_bq_probe)
+    except Exception:
+        logger.warning("BigQuery warmup failed", exc_info=True)
+
+
+@app.on_event("startup")
+async def warm_bigquery_on_startup() -> None:
+    # Credential refresh and connection setup happen here, in the
+    # background, rather than on the first real request.
+    task = asyncio.create_task(_warm_bigquery())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 
-        await run_in_threadpool(_probe)
-        return JSONResponse(status_code=200, content={"status": "ready"})
+@app.get("/readyz")
+async def readyz() -> ORJSONResponse:
+    try:
+        await run_in_threadpool(_bq_probe)
+        return ORJSONResponse(status_code=200, content={"status": "ready"})
     except Exception as e:
         logger.exception("Readiness check failed")
-        return JSONResponse(status_code=503, content={"status": "not_ready", "detail": str(e)})
+        return ORJSONResponse(status_code=503, content={"status": "not_ready", "detail": str(e)})
+
+
+def _wrap_result(principal: str, result_chunks: Iterator[bytes]) -> Iterator[bytes]:
+    yield b'{"principal":' + orjson.dumps(principal) + b',"result":'
+    yield from result_chunks
+    yield b"}"
 
 
 @app.post("/v1/execute")
-async def execute_rest(
-    args: ExecuteArgs,
-    principal: str = Security(principal_dependency),
-) -> Dict[str, Any]:
+async def execute_rest(args: ExecuteArgs, request: Request) -> Response:
+    principal: str = request.state.principal
     policy_engine.assert_allowed(
         principal=principal,
         operation=args.operation.value,
         dataset=args.dataset,
         table=args.table,
     )
+    if args.operation == Operation.SELECT:
+        chunks = await run_in_threadpool(bq_service.stream_select, args)
+        return StreamingResponse(
+            _wrap_result(principal, chunks),
+            media_type="application/json",
+        )
+
     result = await run_in_threadpool(bq_service.execute, args)
-    return {"principal": principal, "result": result}
+    return ORJSONResponse({"principal": principal, "result": result})
 
 
 @app.post("/mcp")
-async def mcp_endpoint(
-    req: JsonRpcRequest,
-    principal: str = Security(principal_dependency),
-) -> JSONResponse:
+async def mcp_endpoint(req: JsonRpcRequest, request: Request) -> ORJSONResponse:
+    principal: str = request.state.principal
+
     async def execute_callable(args: ExecuteArgs):
         policy_engine.assert_allowed(
             principal=principal,
@@ -86,7 +117,7 @@ async def mcp_endpoint(
         return await run_in_threadpool(bq_service.execute, args)
 
     response = await handle_mcp_request(req, execute_callable=execute_callable)
-    return JSONResponse(response)
+    return ORJSONResponse(response)
 
 
 @app.get("/mcp")
@@ -101,14 +132,14 @@ async def mcp_sse_keepalive() -> StreamingResponse:
 
 @app.exception_handler(PermissionError)
 async def permission_error_handler(_, exc: PermissionError):
-    return JSONResponse(status_code=403, content={"detail": str(exc)})
+    return ORJSONResponse(status_code=403, content={"detail": str(exc)})
 
 
 @app.exception_handler(ValueError)
 async def value_error_handler(_, exc: ValueError):
-    return JSONResponse(status_code=400, content={"detail": str(exc)})
+    return ORJSONResponse(status_code=400, content={"detail": str(exc)})
 
 
 @app.exception_handler(HTTPException)
 async def http_error_handler(_, exc: HTTPException):
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    return ORJSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
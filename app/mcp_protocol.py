@@ -1,10 +1,51 @@
 from typing import Any, Awaitable, Callable, Dict
 
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
 
 from .models import ExecuteArgs, JsonRpcRequest
 
 
+ExecuteCallable = Callable[[ExecuteArgs], Awaitable[Dict[str, Any]]]
+
+_EXECUTE_ARGS_ADAPTER = TypeAdapter(ExecuteArgs)
+
+_TOOLS_LIST_RESULT: Dict[str, Any] = {
+    "tools": [
+        {
+            "name": "bigquery.execute",
+            "description": "Run controlled BigQuery operation",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "operation": {"type": "string", "enum": ["SELECT", "CREATE_TABLE", "INSERT", "UPDATE", "DELETE"]},
+                    "dataset": {"type": "string"},
+                    "table": {"type": "string"},
+                    "columns": {"type": "array", "items": {"type": "string"}},
+                    "filters": {"type": "object"},
+                    "limit": {"type": "integer"},
+                    "schema": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "type": {"type": "string"},
+                                "mode": {"type": "string"}
+                            },
+                            "required": ["name", "type"]
+                        }
+                    },
+                    "if_not_exists": {"type": "boolean"},
+                    "rows": {"type": "array", "items": {"type": "object"}},
+                    "set_values": {"type": "object"}
+                },
+                "required": ["operation", "dataset", "table"]
+            },
+        }
+    ]
+}
+
+
 def _rpc_ok(req_id: Any, result: Any) -> Dict[str, Any]:
     return {"jsonrpc": "2.0", "id": req_id, "result": result}
 
@@ -13,68 +54,47 @@ def _rpc_err(req_id: Any, code: int, message: str) -> Dict[str, Any]:
     return {"jsonrpc": "2.0", "id": req_id, "error": {"code": code, "message": message}}
 
 
+async def _handle_list(
+    req: JsonRpcRequest,
+    params: Dict[str, Any],
+    execute_callable: ExecuteCallable,
+) -> Dict[str, Any]:
+    return _rpc_ok(req.id, _TOOLS_LIST_RESULT)
+
+
+async def _handle_call(
+    req: JsonRpcRequest,
+    params: Dict[str, Any],
+    execute_callable: ExecuteCallable,
+) -> Dict[str, Any]:
+    name = params.get("name")
+    if name != "bigquery.execute":
+        return _rpc_err(req.id, -32601, f"Unknown tool: {name}")
+
+    raw_args = params.get("arguments", {})
+    try:
+        parsed = _EXECUTE_ARGS_ADAPTER.validate_python(raw_args)
+    except ValidationError as e:
+        return _rpc_err(req.id, -32602, f"Invalid params: {e}")
+
+    try:
+        result = await execute_callable(parsed)
+        return _rpc_ok(req.id, result)
+    except Exception as e:
+        return _rpc_err(req.id, -32000, str(e))
+
+
+_HANDLERS: Dict[str, Callable[[JsonRpcRequest, Dict[str, Any], ExecuteCallable], Awaitable[Dict[str, Any]]]] = {
+    "tools/list": _handle_list,
+    "tools/call": _handle_call,
+}
+
+
 async def handle_mcp_request(
     req: JsonRpcRequest,
-    execute_callable: Callable[[ExecuteArgs], Awaitable[Dict[str, Any]]],
+    execute_callable: ExecuteCallable,
 ) -> Dict[str, Any]:
-    method = req.method
-    params = req.params or {}
-
-    if method == "tools/list":
-        return _rpc_ok(
-            req.id,
-            {
-                "tools": [
-                    {
-                        "name": "bigquery.execute",
-                        "description": "Run controlled BigQuery operation",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "operation": {"type": "string", "enum": ["SELECT", "CREATE_TABLE", "INSERT", "UPDATE", "DELETE"]},
-                                "dataset": {"type": "string"},
-                                "table": {"type": "string"},
-                                "columns": {"type": "array", "items": {"type": "string"}},
-                                "filters": {"type": "object"},
-                                "limit": {"type": "integer"},
-                                "schema": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "name": {"type": "string"},
-                                            "type": {"type": "string"},
-                                            "mode": {"type": "string"}
-                                        },
-                                        "required": ["name", "type"]
-                                    }
-                                },
-                                "if_not_exists": {"type": "boolean"},
-                                "rows": {"type": "array", "items": {"type": "object"}},
-                                "set_values": {"type": "object"}
-                            },
-                            "required": ["operation", "dataset", "table"]
-                        },
-                    }
-                ]
-            },
-        )
-
-    if method == "tools/call":
-        name = params.get("name")
-        if name != "bigquery.execute":
-            return _rpc_err(req.id, -32601, f"Unknown tool: {name}")
-
-        raw_args = params.get("arguments", {})
-        try:
-            parsed = ExecuteArgs.model_validate(raw_args)
-        except ValidationError as e:
-            return _rpc_err(req.id, -32602, f"Invalid params: {e}")
-
-        try:
-            result = await execute_callable(parsed)
-            return _rpc_ok(req.id, result)
-        except Exception as e:
-            return _rpc_err(req.id, -32000, str(e))
-
-    return _rpc_err(req.id, -32601, f"Unknown method: {method}")
+    handler = _HANDLERS.get(req.method)
+    if handler is None:
+        return _rpc_err(req.id, -32601, f"Unknown method: {req.method}")
+    return await handler(req, req.params or {}, execute_callable)
@@ -1,7 +1,14 @@
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, model_validator
+
+
+ALLOWED_TYPES = frozenset({
+    "STRING", "BYTES", "INT64", "FLOAT64", "NUMERIC", "BIGNUMERIC",
+    "BOOL", "TIMESTAMP", "DATE", "TIME", "DATETIME", "JSON"
+})
+FIELD_MODES = frozenset({"NULLABLE", "REQUIRED", "REPEATED"})
 
 
 class Operation(str, Enum):
@@ -17,18 +24,15 @@ class TableField(BaseModel):
     type: str = Field(description="BigQuery type, e.g. STRING, INT64")
     mode: str = Field(default="NULLABLE", description="NULLABLE | REQUIRED | REPEATED")
 
-    @field_validator("type")
-    @classmethod
-    def upper_type(cls, v: str) -> str:
-        return v.upper()
-
-    @field_validator("mode")
-    @classmethod
-    def upper_mode(cls, v: str) -> str:
-        v = v.upper()
-        if v not in {"NULLABLE", "REQUIRED", "REPEATED"}:
+    @model_validator(mode="after")
+    def _normalize(self) -> "TableField":
+        self.type = self.type.upper()
+        if self.type not in ALLOWED_TYPES:
+            raise ValueError(f"Unsupported BigQuery type: {self.type}")
+        self.mode = self.mode.upper()
+        if self.mode not in FIELD_MODES:
             raise ValueError("mode must be one of NULLABLE, REQUIRED, REPEATED")
-        return v
+        return self
 
 
 class ExecuteArgs(BaseModel):
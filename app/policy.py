@@ -1,39 +1,54 @@
-import json
-import os
-from typing import Any, Dict, List
+import pathlib
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+import orjson
 
 from .config import Settings
 
 
+@dataclass(frozen=True)
+class _CompiledRule:
+    ops: frozenset[str] = frozenset()
+    datasets: Dict[str, frozenset[str]] = field(default_factory=dict)
+    wildcard_datasets: frozenset[str] = frozenset()
+
+
+def _compile(rule: Dict[str, Any]) -> _CompiledRule:
+    datasets = {
+        ds: frozenset(tables) for ds, tables in (rule.get("datasets") or {}).items()
+    }
+    return _CompiledRule(
+        ops=frozenset(
+            op.upper().strip() for op in rule.get("operations", []) if isinstance(op, str)
+        ),
+        datasets=datasets,
+        wildcard_datasets=frozenset(ds for ds, tables in datasets.items() if "*" in tables),
+    )
+
+
 class PolicyEngine:
     def __init__(self, policy_doc: Dict[str, Any]):
         self.policy = policy_doc or {}
-
-    @staticmethod
-    def _normalize_ops(ops: List[str]) -> set[str]:
-        return {op.upper().strip() for op in ops if isinstance(op, str)}
-
-    def _get_rules_for_principal(self, principal: str) -> Dict[str, Any]:
-        principal_l = principal.lower().strip()
-        principals = self.policy.get("principals", {})
-        if principal_l in principals:
-            return principals[principal_l]
-        return self.policy.get("default", {})
+        # Principals arrive already stripped and lowercased from auth, so
+        # keys are normalized the same way once here.
+        self._principals: Dict[str, _CompiledRule] = {
+            p.lower().strip(): _compile(rule or {})
+            for p, rule in (self.policy.get("principals") or {}).items()
+        }
+        self._default = _compile(self.policy.get("default") or {})
 
     def assert_allowed(self, principal: str, operation: str, dataset: str, table: str) -> None:
-        rules = self._get_rules_for_principal(principal)
-        allowed_ops = self._normalize_ops(rules.get("operations", []))
+        rule = self._principals.get(principal, self._default)
 
-        op_u = operation.upper().strip()
-        if op_u not in allowed_ops:
-            raise PermissionError(f"Operation '{op_u}' is not allowed for principal '{principal}'")
+        if operation not in rule.ops:
+            raise PermissionError(f"Operation '{operation}' is not allowed for principal '{principal}'")
 
-        ds_rules: Dict[str, List[str]] = rules.get("datasets", {})
-        tables = ds_rules.get(dataset)
+        tables = rule.datasets.get(dataset)
         if tables is None:
             raise PermissionError(f"Dataset '{dataset}' is not allowed for principal '{principal}'")
 
-        if "*" in tables:
+        if dataset in rule.wildcard_datasets:
             return
 
         if table not in tables:
@@ -46,13 +61,13 @@ def load_policy(settings: Settings) -> PolicyEngine:
     raw = settings.policy_json.strip()
 
     if raw.startswith("{"):
-        policy_doc = json.loads(raw)
+        data = raw
     else:
-        if not os.path.exists(raw):
+        try:
+            data = pathlib.Path(raw).read_bytes()
+        except FileNotFoundError as e:
             raise ValueError(
                 "POLICY_JSON must be a JSON string or path to JSON file."
-            )
-        with open(raw, "r", encoding="utf-8") as f:
-            policy_doc = json.load(f)
+            ) from e
 
-    return PolicyEngine(policy_doc)
+    return PolicyEngine(orjson.loads(data))
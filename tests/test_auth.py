@@ -0,0 +1,179 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+from app.config import Settings
+
+
+def _settings(**kwargs):
+    return Settings(project_id="proj", policy_json="{}", **kwargs)
+
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    """Patches token verification and the clock; returns the list of verified tokens."""
+    calls = []
+
+    def fake_verify(token, audience):
+        calls.append(token)
+        return {"email": "User@Example.com", "exp": NOW + 3600}
+
+    auth._TOKEN_CACHE.clear()
+    auth._INFLIGHT.clear()
+    monkeypatch.setattr(auth, "_verify_token", fake_verify)
+    monkeypatch.setattr(auth, "time", SimpleNamespace(time=lambda: NOW))
+    yield calls
+    auth._TOKEN_CACHE.clear()
+
+
+def _principal(token="tok"):
+    return auth._get_principal(_settings(), f"Bearer {token}", None)
+
+
+def _cache_entry(exp, token="tok"):
+    key = auth.hashlib.sha256(token.encode()).digest()
+    auth._TOKEN_CACHE[key] = {"principal": "cached@example.com", "exp": exp}
+
+
+def _run_middleware(path, root_path="", headers=()):
+    """Returns ("app", scope) when the request reached the app, else the sent status."""
+    reached = {}
+
+    async def app(scope, receive, send):
+        reached["scope"] = scope
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "root_path": root_path,
+        "headers": list(headers),
+    }
+    middleware = auth.PrincipalASGIMiddleware(app, settings=_settings(auth_mode="header"))
+    asyncio.run(middleware(scope, None, send))
+    if "scope" in reached:
+        return "app", reached["scope"]
+    return sent[0]["status"], None
+
+
+@pytest.mark.parametrize("root_path", ["", "/api"])
+def test_middleware_protects_routes_under_root_path(root_path):
+    assert _run_middleware(f"{root_path}/mcp", root_path)[0] == 401
+
+    outcome, scope = _run_middleware(
+        f"{root_path}/mcp", root_path, headers=[(b"x-principal", b" Alice@Example.com ")]
+    )
+    assert outcome == "app"
+    assert scope["state"]["principal"] == "alice@example.com"
+
+
+def test_middleware_only_strips_root_path_at_a_segment_boundary():
+    # "/apimcp" is not "/mcp" under root_path "/api"; the router would not
+    # match it either, so it passes through unauthenticated (and 404s).
+    assert _run_middleware("/apimcp", "/api")[0] == "app"
+    assert _run_middleware("/api", "/api")[0] == "app"
+
+
+def test_verified_token_is_cached(verify_calls):
+    assert asyncio.run(_principal()) == "user@example.com"
+    assert asyncio.run(_principal()) == "user@example.com"
+
+    assert verify_calls == ["tok"]
+
+
+def test_valid_cache_entry_skips_verification(verify_calls):
+    _cache_entry(NOW + auth._EXP_SKEW_SECONDS + 1)
+
+    assert asyncio.run(_principal()) == "cached@example.com"
+    assert verify_calls == []
+
+
+def test_cache_entry_near_expiry_is_reverified(verify_calls):
+    _cache_entry(NOW + auth._EXP_SKEW_SECONDS)
+
+    assert asyncio.run(_principal()) == "user@example.com"
+    assert verify_calls == ["tok"]
+
+
+@pytest.fixture
+def gated_verify(verify_calls, monkeypatch):
+    """Verification that blocks until the returned event is set."""
+    release = threading.Event()
+    fail = {"error": None}
+
+    def fake_verify(token, audience):
+        verify_calls.append(token)
+        release.wait(5)
+        if fail["error"]:
+            raise fail["error"]
+        return {"email": "User@Example.com", "exp": NOW + 3600}
+
+    monkeypatch.setattr(auth, "_verify_token", fake_verify)
+    return release, fail
+
+
+async def _start(n):
+    tasks = [asyncio.create_task(_principal()) for _ in range(n)]
+    while not auth._INFLIGHT:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    return tasks
+
+
+def test_concurrent_misses_share_one_verification(verify_calls, gated_verify):
+    release, _ = gated_verify
+
+    async def scenario():
+        tasks = await _start(20)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == ["user@example.com"] * 20
+    assert verify_calls == ["tok"]
+    assert auth._INFLIGHT == {}
+
+
+def test_failed_verification_is_shared_by_all_waiters(verify_calls, gated_verify):
+    release, fail = gated_verify
+    fail["error"] = ValueError("bad signature")
+
+    async def scenario():
+        tasks = await _start(5)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, HTTPException) and r.status_code == 401 for r in results)
+    assert results[0].detail == "Invalid ID token: bad signature"
+    assert verify_calls == ["tok"]
+    assert auth._INFLIGHT == {}
+
+
+def test_cancelling_the_first_request_does_not_strand_other_waiters(verify_calls, gated_verify):
+    release, _ = gated_verify
+
+    async def scenario():
+        first, second = await _start(2)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        principal = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return principal
+
+    assert asyncio.run(scenario()) == "user@example.com"
+    assert verify_calls == ["tok"]
+    assert auth._INFLIGHT == {}
@@ -0,0 +1,173 @@
+import datetime as dt
+import decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import orjson
+import pytest
+from google.cloud import bigquery
+
+from app import bq_service
+from app.config import Settings
+from app.models import ExecuteArgs
+
+
+@pytest.fixture
+def service():
+    settings = Settings(project_id="proj", policy_json="{}", storage_write_min_rows=2)
+    with mock.patch.object(bq_service.bigquery, "Client"), mock.patch.object(
+        bq_service, "BigQueryWriteClient"
+    ):
+        svc = bq_service.BigQueryService(settings)
+    svc.write_client.write_stream_path.side_effect = bq_service.BigQueryWriteClient.write_stream_path
+    svc.client.insert_rows_json.return_value = []
+    return svc
+
+
+def _insert_args(rows):
+    return ExecuteArgs(operation="INSERT", dataset="ds", table="tb", rows=rows)
+
+
+def _ok_response():
+    return SimpleNamespace(row_errors=[], error=SimpleNamespace(code=0, message=""))
+
+
+def test_build_row_proto_round_trips_rows():
+    desc, message_cls = bq_service._build_row_proto([
+        bigquery.SchemaField("name", "STRING"),
+        bigquery.SchemaField("n", "INTEGER"),
+        bigquery.SchemaField("xs", "FLOAT", mode="REPEATED"),
+    ])
+
+    assert [f.name for f in desc.field] == ["name", "n", "xs"]
+    msg = message_cls.FromString(
+        bq_service._serialize_row(message_cls, {"name": "a", "n": 3, "xs": [1.5], "skip": None})
+    )
+    assert (msg.name, msg.n, list(msg.xs)) == ("a", 3, [1.5])
+
+
+def test_build_row_proto_rejects_unsupported_types():
+    assert bq_service._build_row_proto([bigquery.SchemaField("ts", "TIMESTAMP")]) is None
+
+
+def test_append_rows_sends_routing_header(service):
+    service.client.get_table.return_value.schema = [bigquery.SchemaField("a", "STRING")]
+    service.write_client.append_rows.return_value = iter([_ok_response()])
+
+    result = service.execute(_insert_args([{"a": "x"}, {"a": "y"}]))
+
+    assert result == {"operation": "INSERT", "inserted_rows": 2}
+    service.client.insert_rows_json.assert_not_called()
+    _, kwargs = service.write_client.append_rows.call_args
+    assert kwargs["metadata"] == (
+        ("x-goog-request-params", "write_stream=projects/proj/datasets/ds/tables/tb/streams/_default"),
+    )
+
+
+def test_small_batches_use_insert_rows_json(service):
+    service.execute(_insert_args([{"a": "x"}]))
+
+    service.client.insert_rows_json.assert_called_once_with("proj.ds.tb", [{"a": "x"}])
+    service.write_client.append_rows.assert_not_called()
+
+
+def test_invalid_proto_column_name_falls_back(service):
+    service.client.get_table.return_value.schema = [bigquery.SchemaField("my-col", "STRING")]
+    rows = [{"my-col": "x"}, {"my-col": "y"}]
+
+    service.execute(_insert_args(rows))
+    service.execute(_insert_args(rows))
+
+    assert service.client.insert_rows_json.call_count == 2
+    service.client.get_table.assert_called_once()
+    service.write_client.append_rows.assert_not_called()
+
+
+def test_unencodable_rows_fall_back(service):
+    service.client.get_table.return_value.schema = [bigquery.SchemaField("n", "INTEGER")]
+
+    service.execute(_insert_args([{"n": "not a number"}, {"n": 1}]))
+
+    service.client.insert_rows_json.assert_called_once()
+    service.write_client.append_rows.assert_not_called()
+
+
+def test_row_errors_raise_and_evict_schema(service):
+    service.client.get_table.return_value.schema = [bigquery.SchemaField("a", "STRING")]
+    service.write_client.append_rows.return_value = iter([SimpleNamespace(
+        row_errors=[SimpleNamespace(index=1, message="bad row")],
+        error=SimpleNamespace(code=0, message=""),
+    )])
+
+    with pytest.raises(ValueError, match="bad row"):
+        service.execute(_insert_args([{"a": "x"}, {"a": "y"}]))
+
+    assert "proj.ds.tb" not in service._row_protos
+
+
+def test_normalize_row_encodes_decimal_and_bytes():
+    row = {"n": decimal.Decimal("1.10"), "b": b"\xff\x00", "xs": [b"a"], "s": {"d": decimal.Decimal("2")}}
+
+    assert bq_service._normalize_row(row) == {"n": "1.10", "b": "/wA=", "xs": ["YQ=="], "s": {"d": "2"}}
+
+
+class _FakeRowIterator:
+    def __init__(self, pages, job_id="job_1"):
+        self.pages = pages
+        self.job_id = job_id
+
+
+def _select_args():
+    return ExecuteArgs(operation="SELECT", dataset="ds", table="tb")
+
+
+def test_stream_select_joins_pages_into_one_document(service):
+    service.client.query_and_wait.return_value = _FakeRowIterator(
+        [[{"a": 1}, {"a": b"\x01"}], [{"a": decimal.Decimal("3"), "t": dt.timedelta(seconds=5)}]]
+    )
+
+    body = b"".join(service.stream_select(_select_args()))
+
+    assert orjson.loads(body) == {
+        "operation": "SELECT",
+        "rows": [{"a": 1}, {"a": "AQ=="}, {"a": "3", "t": "0:00:05"}],
+        "row_count": 3,
+        "job_id": "job_1",
+    }
+
+
+def test_stream_select_empty_result(service):
+    service.client.query_and_wait.return_value = _FakeRowIterator([], job_id=None)
+
+    body = b"".join(service.stream_select(_select_args()))
+
+    assert orjson.loads(body) == {"operation": "SELECT", "rows": [], "row_count": 0, "job_id": None}
+
+
+def test_stream_select_first_page_errors_raise_before_streaming(service):
+    service.client.query_and_wait.return_value = _FakeRowIterator([[{"a": 2**64}]])
+
+    with pytest.raises(TypeError):
+        service.stream_select(_select_args())
+
+
+@pytest.mark.parametrize(
+    "column_type, value",
+    [("INTEGER", True), ("BOOLEAN", 1), ("FLOAT", False), ("STRING", 5)],
+)
+def test_mismatched_value_types_fall_back(service, column_type, value):
+    service.client.get_table.return_value.schema = [bigquery.SchemaField("n", column_type)]
+    rows = [{"n": value}, {"n": value}]
+
+    service.execute(_insert_args(rows))
+
+    service.client.insert_rows_json.assert_called_once_with("proj.ds.tb", rows)
+    service.write_client.append_rows.assert_not_called()
+
+
+def test_serialize_row_accepts_ints_for_float_columns():
+    _, message_cls = bq_service._build_row_proto([bigquery.SchemaField("x", "FLOAT", mode="REPEATED")])
+
+    msg = message_cls.FromString(bq_service._serialize_row(message_cls, {"x": [1, 2.5]}))
+
+    assert list(msg.x) == [1.0, 2.5]